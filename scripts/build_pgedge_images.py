@@ -1,11 +1,45 @@
 #!/usr/bin/env python3
 
+import base64
+import hashlib
+import http.client
 import json
 import logging
 import os
+import re
+import signal
 import subprocess
-
-from dataclasses import dataclass
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable
+
+
+def _positive_int_env(name: str, default: str) -> int:
+    value = int(os.getenv(name, default))
+    if value < 1:
+        raise ValueError(f"{name} must be at least 1, got {value}")
+    return value
+
+
+def _parse_native_builders(value: str) -> dict[str, str]:
+    builders = {}
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        arch, sep, builder = entry.partition("=")
+        if not sep or not arch.strip() or not builder.strip():
+            raise ValueError(f"PGEDGE_IMAGE_NATIVE_BUILDERS entries must be arch=builder, got {entry!r}")
+        builders[arch.strip()] = builder.strip()
+    return builders
 
 
 @dataclass
@@ -17,7 +51,15 @@ class Config:
     only_postgres_version: str
     only_spock_version: str
     only_arch: str
+    archs: list[str]
+    native_builders: dict[str, str]
+    builder: str
+    buildkit_config: str
+    buildkit_max_parallelism: int
+    compression: str
     list_latest_tags: bool
+    parallel_limit: int
+    build_parallelism: int
 
     @staticmethod
     def from_env() -> "Config":
@@ -30,18 +72,50 @@ class Config:
             only_postgres_version=os.getenv("PGEDGE_IMAGE_ONLY_POSTGRES_VERSION", ""),
             only_spock_version=os.getenv("PGEDGE_IMAGE_ONLY_SPOCK_VERSION", ""),
             only_arch=os.getenv("PGEDGE_IMAGE_ONLY_ARCH", ""),
+            archs=[
+                arch.strip()
+                for arch in os.getenv("PGEDGE_IMAGE_ARCHS", "amd64,arm64").split(",")
+                if arch.strip()
+            ],
+            native_builders=_parse_native_builders(os.getenv("PGEDGE_IMAGE_NATIVE_BUILDERS", "")),
+            builder=os.getenv("BUILDX_BUILDER", ""),
+            buildkit_config=os.getenv("PGEDGE_BUILDKIT_CONFIG", "./buildkit.toml"),
+            buildkit_max_parallelism=int(os.getenv("PGEDGE_IMAGE_BUILDKIT_MAX_PARALLELISM", "2")),
+            compression=os.getenv("PGEDGE_IMAGE_COMPRESSION", "zstd"),
             list_latest_tags=(os.getenv("PGEDGE_LIST_LATEST_TAGS", "0") == "1"),
+            parallel_limit=_positive_int_env("PGEDGE_IMAGE_PARALLEL_LIMIT", "4"),
+            build_parallelism=_positive_int_env("PGEDGE_IMAGE_BUILD_PARALLELISM", "1"),
         )
 
+    @property
+    def build_archs(self) -> list[str]:
+        return [self.only_arch] if self.only_arch else self.archs
+
+    @property
+    def effective_buildkit_max_parallelism(self) -> int:
+        # Steps from different platforms of a multi-arch build collide with each
+        # other on port 5432, so those builds always run one step at a time.
+        if len(self.build_archs) > 1:
+            return 1
+        return self.buildkit_max_parallelism
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Tag:
     postgres_version: str
     spock_version: str = None
     epoch: int = None
     flavor: str = None
+    _str: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Tags are immutable, so they're only rendered once.
+        object.__setattr__(self, "_str", self._render())
 
     def __str__(self) -> str:
+        return self._str
+
+    def _render(self) -> str:
         tag = f"{self.postgres_version}"
 
         if self.spock_version:
@@ -56,7 +130,7 @@ class Tag:
         return tag
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PgEdgeImage:
     postgres_version: str
     spock_version: str
@@ -65,17 +139,25 @@ class PgEdgeImage:
     is_latest_for_spock_major: bool = False
     flavor: str = ""
     package_release_channel: str = ""
-
-    @property
-    def postgres_major(self) -> str:
-        return self.postgres_version.split(".")[0]
-
-    @property
-    def spock_major(self) -> str:
-        return self.spock_version.split(".")[0]
-
-    @property
-    def package_list(self) -> str:
+    postgres_major: str = field(init=False, repr=False, compare=False)
+    spock_major: str = field(init=False, repr=False, compare=False)
+    package_list: str = field(init=False, repr=False, compare=False)
+    build_tag: Tag = field(init=False, repr=False, compare=False)
+    extra_tags: tuple[Tag, ...] = field(init=False, repr=False, compare=False)
+    all_tags: tuple[Tag, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Images are immutable, so everything derived from their fields is only
+        # computed once.
+        object.__setattr__(self, "postgres_major", self.postgres_version.split(".")[0])
+        object.__setattr__(self, "spock_major", self.spock_version.split(".")[0])
+        object.__setattr__(self, "package_list", self._make_package_list())
+        object.__setattr__(self, "build_tag", self._make_build_tag())
+        extra_tags = tuple(self._make_extra_tags())
+        object.__setattr__(self, "extra_tags", extra_tags)
+        object.__setattr__(self, "all_tags", (self.build_tag, *extra_tags))
+
+    def _make_package_list(self) -> str:
         filename = f"pg{self.postgres_version}-spock{self.spock_version}"
 
         if self.flavor:
@@ -83,8 +165,7 @@ class PgEdgeImage:
 
         return filename + ".txt"
 
-    @property
-    def build_tag(self) -> Tag:
+    def _make_build_tag(self) -> Tag:
         # Immutable tag with epoch
         return Tag(
             postgres_version=self.postgres_version,
@@ -93,8 +174,7 @@ class PgEdgeImage:
             epoch=self.epoch,
         )
 
-    @property
-    def extra_tags(self) -> list[Tag]:
+    def _make_extra_tags(self) -> list[Tag]:
         tags = [
             # Mutable tag without epoch
             Tag(
@@ -126,10 +206,6 @@ class PgEdgeImage:
 
         return tags
 
-    @property
-    def all_tags(self) -> list[Tag]:
-        return [self.build_tag, *self.extra_tags]
-
 
 def make_all_flavor_images(
     postgres_version: str,
@@ -139,21 +215,18 @@ def make_all_flavor_images(
     is_latest_for_spock_major: bool = False,
     package_release_channel: str = "",
 ) -> list[PgEdgeImage]:
-    images: list[PgEdgeImage] = []
-    for flavor in ["minimal", "standard"]:
-        images.append(
-            PgEdgeImage(
-                postgres_version=postgres_version,
-                spock_version=spock_version,
-                epoch=epoch,
-                is_latest_for_pg_major=is_latest_for_pg_major,
-                is_latest_for_spock_major=is_latest_for_spock_major,
-                flavor=flavor,
-                package_release_channel=package_release_channel,
-            )
+    return [
+        PgEdgeImage(
+            postgres_version=postgres_version,
+            spock_version=spock_version,
+            epoch=epoch,
+            is_latest_for_pg_major=is_latest_for_pg_major,
+            is_latest_for_spock_major=is_latest_for_spock_major,
+            flavor=flavor,
+            package_release_channel=package_release_channel,
         )
-
-    return images
+        for flavor in ("minimal", "standard")
+    ]
 
 
 # This is the list of all images that this script will build. Any new images should be
@@ -187,47 +260,634 @@ all_images: list[PgEdgeImage] = [
 
 
 def validate_images(images: list[PgEdgeImage]):
-    all_tags = set()
+    # Tags are compared by their rendered form since that's what ends up in the
+    # registry.
+    seen: set[str] = set()
+    duplicates: list[str] = []
 
     for image in images:
-        image_tags = set(map(str, image.all_tags))
-        overlap = all_tags.intersection(image_tags)
-        if len(overlap) != 0:
-            invalid = ", ".join(overlap)
-            raise ValueError(f"images list produces duplicate tags: {invalid}")
-        all_tags.update(image_tags)
+        for tag in {str(tag) for tag in image.all_tags}:
+            if tag in seen:
+                duplicates.append(tag)
+            seen.add(tag)
+
+    if duplicates:
+        invalid = ", ".join(sorted(duplicates))
+        raise ValueError(f"images list produces duplicate tags: {invalid}")
+
+
+# Catch duplicate tags as soon as the list is defined, before any commands run.
+validate_images(all_images)
+
+
+@contextmanager
+def timed(step: str, **fields):
+    """
+    Logs how long the enclosed step took as key=value pairs, e.g.
+    "step=sign tag=17-spock5-standard elapsed_ms=1520", so that the slowest steps
+    can be found with standard text tools.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        logging.info(
+            "step=%s%s elapsed_ms=%d",
+            step,
+            "".join(f" {key}={value}" for key, value in fields.items()),
+            (time.perf_counter() - start) * 1000,
+        )
 
 
 def bake_cmd(*args: str) -> list[str]:
     return ["docker", "buildx", "bake", "--file", "pgedge.docker-bake.hcl", *args]
 
 
+# Processes started by run() that haven't exited yet. They run in their own
+# sessions, so they're stopped explicitly when this script is interrupted.
+_running_processes: set[subprocess.Popen] = set()
+_running_processes_lock = threading.Lock()
+
+# Set when the run is interrupted so that worker threads stop starting commands.
+_stop = threading.Event()
+
+# Set when an image fails so that images waiting for a build slot don't build.
+_image_failed = threading.Event()
+
+
+def _check_interrupted():
+    if _stop.is_set():
+        raise RuntimeError("interrupted")
+
+
+def _interrupt_process(proc: subprocess.Popen):
+    try:
+        # Signal the whole process group so that e.g. bake's children stop too.
+        os.killpg(proc.pid, signal.SIGINT)
+    except ProcessLookupError:
+        pass
+
+
+def run(
+    cmd: list[str],
+    env: dict[str, str] | None = None,
+    on_line: Callable[[str], None] = logging.info,
+):
+    """
+    Runs the command and passes each line of its combined stdout and stderr to
+    on_line as it's produced, rather than holding all of it until the command exits.
+    Raises CalledProcessError if the command fails.
+    """
+    _check_interrupted()
+    with subprocess.Popen(
+        cmd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        bufsize=1,
+        text=True,
+        errors="replace",
+        close_fds=True,
+        start_new_session=True,
+    ) as proc:
+        try:
+            with _running_processes_lock:
+                _running_processes.add(proc)
+            if _stop.is_set():
+                # The interrupt arrived after the check above but before the
+                # process was tracked, so it wasn't signalled.
+                _interrupt_process(proc)
+            for line in proc.stdout:
+                on_line(line.rstrip())
+            returncode = proc.wait()
+        except KeyboardInterrupt:
+            # The process is in its own session, so Ctrl-C doesn't reach it. Stop
+            # it here, because Popen waits for it to exit.
+            _interrupt_process(proc)
+            raise
+        finally:
+            with _running_processes_lock:
+                _running_processes.discard(proc)
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def _parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class BakeProgress:
+    """
+    Logs the output of a bake run with --progress=rawjson. In addition to each
+    step's own output, this logs how long every step took so that slow steps are
+    easy to find.
+    """
+
+    def __init__(self):
+        self._names: dict[str, str] = {}
+        self._completed: set[str] = set()
+
+    def __call__(self, line: str):
+        try:
+            status = json.loads(line)
+        except ValueError:
+            # Errors and other messages from buildx itself aren't JSON.
+            logging.info(line)
+            return
+        if not isinstance(status, dict):
+            logging.info(line)
+            return
+
+        for vertex in status.get("vertexes") or []:
+            self._log_vertex(vertex)
+
+        for entry in status.get("logs") or []:
+            data = base64.b64decode(entry.get("data") or "").decode(errors="replace")
+            for output in data.splitlines():
+                logging.info(output)
+
+        for warning in status.get("warnings") or []:
+            message = base64.b64decode(warning.get("short") or "").decode(errors="replace")
+            logging.warning(message)
+
+    def _log_vertex(self, vertex: dict):
+        digest = vertex.get("digest")
+        name = vertex.get("name") or self._names.get(digest, digest)
+        self._names[digest] = name
+
+        if not vertex.get("completed") or digest in self._completed:
+            return
+        self._completed.add(digest)
+
+        if vertex.get("error"):
+            logging.error("step failed: %s: %s", name, vertex["error"])
+            return
+        if vertex.get("cached"):
+            logging.info("step cached: %s", name)
+            return
+
+        started = _parse_timestamp(vertex.get("started"))
+        completed = _parse_timestamp(vertex.get("completed"))
+        if started and completed:
+            logging.info("step completed in %.2fs: %s", (completed - started).total_seconds(), name)
+        else:
+            logging.info("step completed: %s", name)
+
+
 def imagetools_cmd(*args: str) -> list[str]:
     return ["docker", "buildx", "imagetools", *args]
 
-def index_digest(repo: str, tag: str) -> str:
-    out = subprocess.check_output(
-        imagetools_cmd("inspect", f"{repo}:{tag}", "--format", "{{ printf \"%s\" .Manifest.Digest }}"),
-        stderr=subprocess.PIPE,
-    )
+def _inspect_index_digest(repo: str, tag: str) -> str | None:
+    try:
+        out = subprocess.check_output(
+            imagetools_cmd("inspect", f"{repo}:{tag}", "--format", "{{ printf \"%s\" .Manifest.Digest }}"),
+            stderr=subprocess.PIPE,
+        )
+    except subprocess.CalledProcessError:
+        return None
     return out.decode().strip()
 
-def published_digests(repo: str, tag: Tag) -> set[str]:
-    logging.info(f"checking repository {repo} for tag {tag}")
 
+# Media types accepted from the registry when fetching manifests.
+MANIFEST_MEDIA_TYPES = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+
+
+class RegistryError(Exception):
+    pass
+
+
+class RegistryAuthError(RegistryError):
+    pass
+
+
+DOCKER_HUB_HOST = "registry-1.docker.io"
+# Docker stores Docker Hub credentials under the old index URL.
+DOCKER_HUB_AUTH_KEY = "https://index.docker.io/v1/"
+
+
+def _split_repo(repo: str) -> tuple[str, str]:
+    """
+    Splits the repository into its registry host and name the same way docker
+    does: the first component is only a host if it looks like one, and anything
+    else is a Docker Hub repository.
+    """
+    host, sep, name = repo.partition("/")
+    if not sep or not ("." in host or ":" in host or host == "localhost"):
+        host, name = "docker.io", repo
+    if host in ("docker.io", "index.docker.io"):
+        host = DOCKER_HUB_HOST
+        if "/" not in name:
+            # Official images live under library/, e.g. "postgres".
+            name = f"library/{name}"
+    return host, name
+
+
+class RegistryClient:
+    """
+    Minimal client for the registry HTTP API. Each thread keeps its own connection
+    alive across requests, and the bearer token is shared between threads.
+    """
+
+    def __init__(self, repo: str):
+        host, name = _split_repo(repo)
+        self.host = host
+        self.name = name
+        self.auth_key = DOCKER_HUB_AUTH_KEY if host == DOCKER_HUB_HOST else host
+        self.secure = not host.startswith(("127.0.0.1", "localhost"))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._authorization: str | None = None
+        self._auth_failed = False
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.secure:
+                conn = http.client.HTTPSConnection(self.host, timeout=30)
+            else:
+                conn = http.client.HTTPConnection(self.host, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _send(
+        self, method: str, path: str, headers: dict[str, str]
+    ) -> tuple[http.client.HTTPResponse, bytes]:
+        conn = self._connection()
+        try:
+            conn.request(method, path, headers=headers)
+            resp = conn.getresponse()
+            # Always drain the body so that the connection can be reused.
+            return resp, resp.read()
+        except Exception:
+            # A failed request can leave the connection in a state where it can't
+            # send another one, so the next request starts from a new connection.
+            self._reset_connection()
+            raise
+
+    def _request(
+        self, method: str, path: str, headers: dict[str, str]
+    ) -> tuple[http.client.HTTPResponse, bytes]:
+        try:
+            return self._send(method, path, headers)
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            # The registry closed the idle connection, so retry once on a new one.
+            return self._send(method, path, headers)
+
+    def _credentials(self) -> str | None:
+        config_dir = os.getenv("DOCKER_CONFIG", os.path.expanduser("~/.docker"))
+        try:
+            with open(os.path.join(config_dir, "config.json")) as f:
+                auths = json.load(f).get("auths", {})
+        except (OSError, ValueError):
+            return None
+        return auths.get(self.auth_key, {}).get("auth")
+
+    def _authenticate(self, challenge: str):
+        scheme, _, params = challenge.partition(" ")
+        credentials = self._credentials()
+
+        if scheme.lower() == "basic":
+            if credentials is None:
+                raise RegistryAuthError(f"no credentials found for {self.host}")
+            self._authorization = f"Basic {credentials}"
+            return
+
+        fields = dict(re.findall(r'(\w+)="([^"]*)"', params))
+        if scheme.lower() != "bearer" or "realm" not in fields:
+            raise RegistryAuthError(f"unsupported auth challenge from {self.host}: {challenge}")
+
+        query = {k: v for k, v in fields.items() if k in ("service", "scope")}
+        req = urllib.request.Request(f"{fields['realm']}?{urllib.parse.urlencode(query)}")
+        if credentials is not None:
+            req.add_header("Authorization", f"Basic {credentials}")
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                body = json.load(resp)
+        except (OSError, ValueError) as e:
+            raise RegistryAuthError(f"failed to get token from {fields['realm']}: {e}") from e
+
+        token = body.get("token") or body.get("access_token")
+        if not token:
+            raise RegistryAuthError(f"no token returned by {fields['realm']}")
+        self._authorization = f"Bearer {token}"
+
+    def _manifest_request(self, method: str, reference: str) -> tuple[http.client.HTTPResponse, bytes] | None:
+        if self._auth_failed:
+            raise RegistryAuthError(f"not authorized for {self.host}/{self.name}")
+
+        path = f"/v2/{self.name}/manifests/{reference}"
+        headers = {"Accept": MANIFEST_MEDIA_TYPES}
+        if self._authorization:
+            headers["Authorization"] = self._authorization
+
+        resp, body = self._request(method, path, headers)
+        if resp.status == 401:
+            with self._lock:
+                try:
+                    if self._authorization == headers.get("Authorization"):
+                        self._authenticate(resp.headers.get("WWW-Authenticate", ""))
+                except RegistryAuthError:
+                    self._auth_failed = True
+                    raise
+            headers["Authorization"] = self._authorization
+            resp, body = self._request(method, path, headers)
+
+        if resp.status in (401, 403):
+            self._auth_failed = True
+            raise RegistryAuthError(f"not authorized for {self.host}/{self.name}")
+        if resp.status == 404:
+            return None
+        if resp.status != 200:
+            raise RegistryError(f"unexpected status {resp.status} for {method} {self.host}{path}")
+
+        return resp, body
+
+    def manifest_digest(self, reference: str) -> str | None:
+        """
+        Returns the digest of the manifest for the given tag, or None if it does not
+        exist. Raises RegistryAuthError if the registry refuses our credentials, or
+        RegistryError if it responds with any other unexpected status.
+        """
+        # A HEAD request is enough when the registry reports the digest in its
+        # response headers, which saves transferring the manifest itself.
+        result = self._manifest_request("HEAD", reference)
+        if result is None:
+            return None
+        digest = result[0].headers.get("Docker-Content-Digest")
+        if digest:
+            return digest
+
+        result = self._manifest_request("GET", reference)
+        if result is None:
+            return None
+        resp, body = result
+        return resp.headers.get("Docker-Content-Digest") or "sha256:" + hashlib.sha256(body).hexdigest()
+
+
+_registry_clients: dict[str, RegistryClient] = {}
+_registry_clients_lock = threading.Lock()
+
+
+def registry_client(repo: str) -> RegistryClient:
+    with _registry_clients_lock:
+        if repo not in _registry_clients:
+            _registry_clients[repo] = RegistryClient(repo)
+        return _registry_clients[repo]
+
+
+def _fetch_index_digest(repo: str, tag: str) -> str | None:
+    logging.info("checking repository %s for tag %s", repo, tag)
+
+    with timed("index_digest", tag=tag):
+        try:
+            return registry_client(repo).manifest_digest(tag)
+        except (RegistryError, OSError, http.client.HTTPException) as e:
+            # Docker may have credentials or network settings that we can't use
+            # directly, e.g. from a credential helper, and it retries throttled or
+            # failed requests, so let it do the lookup instead.
+            logging.debug("falling back to imagetools inspect: %s", e)
+            return _inspect_index_digest(repo, tag)
+
+
+# Index digests keyed by (repo, tag), with None for tags that don't exist. Entries
+# are dropped whenever this script pushes to a tag so that subsequent lookups
+# reflect the new manifest.
+_index_digests_cache: dict[tuple[str, str], str | None] = {}
+_index_digests_lock = threading.Lock()
+
+# The maximum number of concurrent registry lookups.
+REGISTRY_LOOKUP_CONCURRENCY = 16
+
+
+def index_digest(repo: str, tag: Tag | str) -> str | None:
+    """
+    Returns the digest of the manifest list that the tag points to, or None if
+    the tag does not exist.
+    """
+    key = (repo, str(tag))
+    with _index_digests_lock:
+        if key in _index_digests_cache:
+            return _index_digests_cache[key]
+
+    digest = _fetch_index_digest(repo, str(tag))
+
+    with _index_digests_lock:
+        _index_digests_cache[key] = digest
+    return digest
+
+
+def bulk_index_digests(repo: str, tags: list[str]) -> dict[str, str | None]:
+    """
+    Looks up the index digests for several tags concurrently and stores the
+    results for subsequent index_digest calls.
+    """
+    with ThreadPoolExecutor(
+        max_workers=REGISTRY_LOOKUP_CONCURRENCY,
+        thread_name_prefix="registry",
+    ) as executor:
+        results = dict(zip(tags, executor.map(lambda tag: _fetch_index_digest(repo, tag), tags)))
+
+    with _index_digests_lock:
+        _index_digests_cache.update(((repo, tag), digest) for tag, digest in results.items())
+    return results
+
+
+def invalidate_index_digest(repo: str, tag: Tag | str):
+    with _index_digests_lock:
+        _index_digests_cache.pop((repo, str(tag)), None)
+
+
+def native_cross_available(builders: dict[str, str], archs: list[str]) -> bool:
+    """
+    Returns True if every architecture has its own builder that we can reach, in
+    which case each architecture can be built natively instead of under emulation.
+    """
+    if not builders:
+        return False
+
+    for arch in archs:
+        builder = builders.get(arch)
+        if builder is None:
+            logging.warning("no native builder configured for %s", arch)
+            return False
+        try:
+            subprocess.check_output(
+                ["docker", "buildx", "inspect", builder],
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError:
+            logging.warning("native builder %s for %s is unavailable", builder, arch)
+            return False
+
+    return True
+
+
+def buildkitd_config(base_file: str, max_parallelism: int) -> str:
+    """
+    Returns the contents of the given buildkitd config with the worker's
+    max-parallelism set to the given value. A missing config file is an error,
+    because the builder would be created without its registry settings.
+    """
+    with open(base_file) as f:
+        lines = f.read().splitlines()
+
+    lines = [line for line in lines if not line.strip().startswith("max-parallelism")]
+    setting = f"  max-parallelism = {max_parallelism}"
+
+    headers = [line.strip() for line in lines]
+    if "[worker.oci]" in headers:
+        lines.insert(headers.index("[worker.oci]") + 1, setting)
+    else:
+        lines.extend(("[worker.oci]", setting))
+
+    return "\n".join(lines) + "\n"
+
+
+def ensure_builder(
+    name: str,
+    config_file: str,
+    archs: list[str],
+    max_parallelism: int,
+    dry_run: bool,
+):
+    """
+    Creates the named buildx builder with the same settings as `make buildx-init`
+    if it doesn't exist yet. The builder's max-parallelism is set at creation, so
+    builders that already exist keep their current setting.
+    """
     try:
-        out = subprocess.check_output(
-            imagetools_cmd("inspect", "--raw", f"{repo}:{tag}"),
+        subprocess.check_output(
+            ["docker", "buildx", "inspect", name],
             stderr=subprocess.PIPE,
         )
-        raw = json.loads(out)
-        return set(
-            manifest.get("digest")
-            for manifest in raw.get("manifests", [])
-            if manifest.get("digest") is not None
-        )
+        return
     except subprocess.CalledProcessError:
-        return set()
+        pass
+
+    logging.info(
+        "creating buildx builder %s with config %s and max-parallelism %d",
+        name,
+        config_file,
+        max_parallelism,
+    )
+
+    if dry_run:
+        logging.info("skipping builder creation")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # buildx copies the config into the builder when it's created.
+        generated_config = os.path.join(tmp, "buildkitd.toml")
+        with open(generated_config, "w") as f:
+            f.write(buildkitd_config(config_file, max_parallelism))
+
+        run(
+            [
+                "docker",
+                "buildx",
+                "create",
+                f"--name={name}",
+                "--driver=docker-container",
+                "--platform=" + ",".join(f"linux/{arch}" for arch in archs),
+                f"--config={generated_config}",
+            ]
+        )
+
+
+# The only variables from our environment that are passed to bake. Everything
+# docker and buildx need to find the daemon, builder, and credentials is here.
+# Bake turns the variables declared in pgedge.docker-bake.hcl into build args,
+# which are part of the build cache keys. Those variables are set explicitly in
+# _bake, so unrelated CI variables can't change the cache keys or leak into
+# builds.
+_BAKE_ENV = {
+    "HOME",
+    "PATH",
+    "XDG_RUNTIME_DIR",
+    "DOCKER_HOST",
+    "DOCKER_CONFIG",
+    "DOCKER_CONTEXT",
+    "DOCKER_CERT_PATH",
+    "DOCKER_TLS_VERIFY",
+    "BUILDX_BUILDER",
+    "BUILDX_CONFIG",
+    "BUILDKIT_HOST",
+    "SSH_AUTH_SOCK",
+}
+
+
+def _bake(
+    repo: str,
+    image: PgEdgeImage,
+    tag: str,
+    platforms: list[str],
+    no_cache: bool,
+    compression: str,
+    cache_ref: str,
+    builder: str | None = None,
+) -> str | None:
+    bake_args = [
+        "--push",
+        "--set",
+        f"default.output=type=registry,push=true,compression={compression},oci-mediatypes=true",
+        "--set",
+        f"default.cache-to=type=registry,ref={cache_ref},mode=max,compression=zstd,"
+        "compression-level=3,force-compression=true,oci-mediatypes=true",
+        "--set",
+        "default.platform=" + ",".join(f"linux/{arch}" for arch in platforms),
+        *(
+            ["--no-cache"]
+            if no_cache
+            else ["--set", f"default.cache-from=type=registry,ref={cache_ref}"]
+        ),
+    ]
+
+    env = {k: v for k, v in os.environ.items() if k in _BAKE_ENV}
+    env.update(
+        {
+            "DOCKER_BUILDKIT": "1",
+            "PACKAGE_RELEASE_CHANNEL": image.package_release_channel,
+            "POSTGRES_MAJOR_VERSION": image.postgres_major,
+            "PACKAGE_LIST_FILE": image.package_list,
+            "TAG": f"{repo}:{tag}",
+            "TARGET": image.flavor,
+        }
+    )
+    if builder:
+        env["BUILDX_BUILDER"] = builder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        metadata_file = os.path.join(tmp, "metadata.json")
+        bake_args.extend(("--metadata-file", metadata_file))
+
+        run(bake_cmd("--progress=rawjson", *bake_args), env=env, on_line=BakeProgress())
+
+        try:
+            with open(metadata_file) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    return metadata.get("default", {}).get("containerimage.digest")
 
 
 def build(
@@ -235,66 +895,179 @@ def build(
     image: PgEdgeImage,
     dry_run: bool,
     no_cache: bool,
-    only_arch: str,
-):
+    archs: list[str],
+    native_builders: dict[str, str],
+    compression: str,
+) -> str | None:
+    """
+    Builds and pushes the image. Returns the digest of the pushed manifest if buildx
+    reported one.
+
+    When native_builders is non-empty, each architecture is built on its own builder
+    and pushed with an architecture suffix, e.g. "<build tag>-arm64". The resulting
+    images are then combined into a single manifest list under the build tag.
+    """
     logging.info("building and pushing images")
 
     if dry_run:
         logging.info("skipping image build")
-        return
+        return None
 
-    if repo.startswith("127.0.0.1"):
+    push_repo = repo
+    if push_repo.startswith("127.0.0.1"):
         # The buildx builder is its own container, and it doesn't share the host network
         # namespace.
-        repo = repo.replace("127.0.0.1", "host.docker.internal")
-
-    bake_args = ["--push"]
-    if no_cache:
-        bake_args.append("--no-cache")
-    if only_arch:
-        bake_args.extend(("--set", f"default.platform=linux/{only_arch}"))
-
-    subprocess.check_output(
-        bake_cmd(*bake_args),
-        env={
-            **os.environ.copy(),
-            "PACKAGE_RELEASE_CHANNEL": image.package_release_channel,
-            "POSTGRES_MAJOR_VERSION": image.postgres_major,
-            "PACKAGE_LIST_FILE": image.package_list,
-            "TAG": f"{repo}:{image.build_tag}",
-            "TARGET": image.flavor,
-        },
+        push_repo = push_repo.replace("127.0.0.1", "host.docker.internal")
+
+    # Layers are cached in the image repository itself. Each postgres major and
+    # flavor gets its own cache so that their builds don't evict each other.
+    cache_ref = f"{push_repo}:buildcache-{image.postgres_major}-{image.flavor}"
+
+    if len(archs) == 1 or not native_builders:
+        digest = _bake(
+            repo=push_repo,
+            image=image,
+            tag=str(image.build_tag),
+            platforms=archs,
+            no_cache=no_cache,
+            compression=compression,
+            cache_ref=cache_ref,
+            builder=native_builders.get(archs[0]) if len(archs) == 1 else None,
+        )
+        invalidate_index_digest(repo, image.build_tag)
+        return digest
+
+    arch_tags = [f"{image.build_tag}-{arch}" for arch in archs]
+    with ThreadPoolExecutor(
+        max_workers=len(archs),
+        thread_name_prefix=f"{threading.current_thread().name}-bake",
+    ) as executor:
+        futures = [
+            executor.submit(
+                _bake,
+                repo=push_repo,
+                image=image,
+                tag=arch_tag,
+                platforms=[arch],
+                no_cache=no_cache,
+                compression=compression,
+                cache_ref=f"{cache_ref}-{arch}",
+                builder=native_builders[arch],
+            )
+            for arch, arch_tag in zip(archs, arch_tags)
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+    logging.info("combining %s into %s", ", ".join(arch_tags), image.build_tag)
+    run(
+        imagetools_cmd(
+            "create",
+            "--tag",
+            f"{repo}:{image.build_tag}",
+            *(f"{repo}:{arch_tag}" for arch_tag in arch_tags),
+        )
     )
+    invalidate_index_digest(repo, image.build_tag)
+    return None
 
 
-def sign(repo: str, digest: str, dry_run: bool):
-    logging.info(f"signing image {repo}:{digest}")
+def sign(repo: str, digest: str, dry_run: bool, attempts: int = 3):
+    logging.info("signing image %s:%s", repo, digest)
 
     if dry_run:
         logging.info("skipping image signing")
         return
 
-    subprocess.check_output(
-        [
-            "cosign",
-            "sign",
-            "--yes",
-            f"{repo}@{digest}",
-        ]
-    )
+    # Signing the same digest again is harmless, so transient Fulcio or Rekor
+    # failures are retried.
+    with timed("sign", digest=digest):
+        for attempt in range(1, attempts + 1):
+            try:
+                run(
+                    [
+                        "cosign",
+                        "sign",
+                        "--yes",
+                        f"{repo}@{digest}",
+                    ]
+                )
+                return
+            except subprocess.CalledProcessError:
+                if attempt == attempts:
+                    raise
+                delay = 2**attempt
+                logging.warning("signing image %s:%s failed, retrying in %ds", repo, digest, delay)
+                # Wakes up early if interrupted, and the retry then refuses to run.
+                _stop.wait(delay)
+
+
+# Signing only depends on the pushed digest, so it runs in the background while
+# the pipeline moves on to the next build. An image's extra tags are only added
+# after its own signature, so they never point at an unsigned image.
+_sign_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sign")
+_pending_signatures: list[Future] = []
+_pending_signatures_lock = threading.Lock()
+
+
+def _sign_and_tag(config: "Config", image: "PgEdgeImage", build_digest: str):
+    sign(repo=config.repo, digest=build_digest, dry_run=config.dry_run)
+    _process_extra_tags(config, image, build_digest)
+
+
+def sign_and_tag_async(config: "Config", image: "PgEdgeImage", build_digest: str):
+    future = _sign_executor.submit(_sign_and_tag, config, image, build_digest)
+    with _pending_signatures_lock:
+        _pending_signatures.append(future)
+
+
+def wait_for_signatures():
+    """
+    Waits for every image submitted with sign_and_tag_async to be signed and
+    tagged, and raises the first failure.
+    """
+    with _pending_signatures_lock:
+        pending = list(_pending_signatures)
+    for future in as_completed(pending):
+        future.result()
+
+
+def _handle_interrupt(signum, frame):
+    # The handler runs on the main thread, which may be holding any lock when the
+    # signal arrives, so it mustn't take any. main() does the cleanup.
+    _stop.set()
+    signal.default_int_handler(signum, frame)
+
+
+def _stop_work():
+    logging.warning("interrupted. cancelling pending images, signing and tagging and stopping running commands.")
+    _sign_executor.shutdown(wait=False, cancel_futures=True)
+    with _running_processes_lock:
+        running = list(_running_processes)
+    for proc in running:
+        _interrupt_process(proc)
+
+
+def add_tags(repo: str, existing_tag: Tag, new_tags: list[Tag], dry_run: bool):
+    if not new_tags:
+        return
 
-def add_tag(repo: str, existing_tag: Tag, new_tag: Tag, dry_run: bool):
     logging.info(
-        f"adding new tag {new_tag} to existing manifest with tag {existing_tag}"
+        "adding new tags %s to existing manifest with tag %s",
+        ", ".join(map(str, new_tags)),
+        existing_tag,
     )
 
     if dry_run:
         logging.info("skipping tag creation")
         return
 
-    subprocess.check_output(
-        imagetools_cmd("create", "--tag", f"{repo}:{new_tag}", f"{repo}:{existing_tag}")
-    )
+    # imagetools accepts multiple tags, so every tag is pushed by one invocation.
+    tag_args = [arg for tag in new_tags for arg in ("--tag", f"{repo}:{tag}")]
+    with timed("add_tags", tag=existing_tag):
+        run(imagetools_cmd("create", *tag_args, f"{repo}:{existing_tag}"))
+    for tag in new_tags:
+        invalidate_index_digest(repo, tag)
 
 
 def _log_config(config: "Config") -> None:
@@ -305,11 +1078,20 @@ def _log_config(config: "Config") -> None:
     if config.no_cache:
         logging.info("no cache enabled. images will be built without cache.")
     if config.only_postgres_version:
-        logging.info(f"only postgres {config.only_postgres_version} enabled. other images will be skipped.")
+        logging.info("only postgres %s enabled. other images will be skipped.", config.only_postgres_version)
     if config.only_spock_version:
-        logging.info(f"only spock {config.only_spock_version} enabled. other images will be skipped.")
+        logging.info("only spock %s enabled. other images will be skipped.", config.only_spock_version)
     if config.only_arch:
-        logging.info(f"only arch {config.only_arch} enabled. builds will target linux/{config.only_arch} only.")
+        logging.info("only arch %s enabled. builds will target linux/%s only.", config.only_arch, config.only_arch)
+    else:
+        logging.info("builds will target %s.", ", ".join(f"linux/{arch}" for arch in config.archs))
+    logging.info("image layers will be compressed with %s.", config.compression)
+    logging.info("new builders will use buildkit max-parallelism %d.", config.effective_buildkit_max_parallelism)
+    logging.info(
+        "processing up to %d images concurrently with up to %d concurrent builds.",
+        config.parallel_limit,
+        config.build_parallelism,
+    )
 
 
 def _should_skip_image(image: "PgEdgeImage", config: "Config") -> bool:
@@ -320,34 +1102,70 @@ def _should_skip_image(image: "PgEdgeImage", config: "Config") -> bool:
     return False
 
 
-def _process_extra_tags(config: "Config", image: "PgEdgeImage", published: set) -> None:
+def _process_extra_tags(config: "Config", image: "PgEdgeImage", build_digest: str | None) -> None:
+    new_tags: list[Tag] = []
     for tag in image.extra_tags:
-        tag_published = published_digests(config.repo, tag)
-        if config.republish or tag_published != published:
-            add_tag(repo=config.repo, existing_tag=image.build_tag, new_tag=tag, dry_run=config.dry_run)
-        else:
-            logging.info(f"{tag} is already up-to-date")
-
-
-def _process_image(config: "Config", image: "PgEdgeImage") -> None:
-    published = published_digests(config.repo, image.build_tag)
-    if len(published) == 0 or config.republish:
-        build(repo=config.repo, image=image, dry_run=config.dry_run, no_cache=config.no_cache, only_arch=config.only_arch)
+        # A tag that already points at the build tag's manifest list has nothing to
+        # update. Comparing the index digests is exact, unlike comparing the
+        # platform manifests that they contain.
+        if not config.republish and build_digest is not None and index_digest(config.repo, tag) == build_digest:
+            logging.info("%s is already up-to-date", tag)
+            continue
+        new_tags.append(tag)
+
+    add_tags(repo=config.repo, existing_tag=image.build_tag, new_tags=new_tags, dry_run=config.dry_run)
+
+
+def _process_image(
+    config: "Config",
+    image: "PgEdgeImage",
+    build_slots: threading.Semaphore,
+    native_builders: dict[str, str],
+) -> None:
+    build_digest = index_digest(config.repo, image.build_tag)
+    if build_digest is None or config.republish:
+        # Builds are serialized separately from the rest of the pipeline because
+        # concurrent multi-arch bakes collide with each other on the builder.
+        with build_slots:
+            # The run may have been interrupted, or another image may have failed,
+            # while this image waited for a slot.
+            _check_interrupted()
+            if _image_failed.is_set():
+                raise RuntimeError(f"not building {image.build_tag} because another image failed")
+            try:
+                with timed("build", tag=image.build_tag):
+                    digest = build(
+                        repo=config.repo,
+                        image=image,
+                        dry_run=config.dry_run,
+                        no_cache=config.no_cache,
+                        archs=config.build_archs,
+                        native_builders=native_builders,
+                        compression=config.compression,
+                    )
+            except BaseException:
+                # Flag the failure before releasing the slot, so that the next
+                # image to take it doesn't start a build.
+                _image_failed.set()
+                raise
         if not config.dry_run:
-            digest = index_digest(config.repo, image.build_tag)
-            sign(repo=config.repo, digest=digest, dry_run=config.dry_run)
-            published = published_digests(config.repo, image.build_tag)
-        else:
-            logging.info("dry run enabled; skipping digest lookup and signing")
+            build_digest = digest or index_digest(config.repo, image.build_tag)
+            if build_digest is None:
+                raise RuntimeError(f"{image.build_tag} was not found after it was published")
+            sign_and_tag_async(config, image, build_digest)
+            return
+        logging.info("dry run enabled; skipping digest lookup and signing")
     else:
-        logging.info(f"{image.build_tag} is already published")
-    _process_extra_tags(config, image, published)
+        logging.info("%s is already published", image.build_tag)
+    _process_extra_tags(config, image, build_digest)
 
 
 def main():
     logging.basicConfig(
         level=logging.INFO,
-        format="%(levelname)s: %(message)s",
+        # Millisecond timestamps make it possible to see how long each step took.
+        format="%(asctime)s.%(msecs)03d %(levelname)s: [%(threadName)s] %(message)s",
+        datefmt="%H:%M:%S",
     )
 
     config = Config.from_env()
@@ -357,13 +1175,62 @@ def main():
         return
 
     _log_config(config)
-    validate_images(all_images)
+    signal.signal(signal.SIGINT, _handle_interrupt)
 
+    images: list[PgEdgeImage] = []
     for image in all_images:
         if _should_skip_image(image, config):
-            logging.info(f"skipping image {image.build_tag}")
+            logging.info("skipping image %s", image.build_tag)
             continue
-        _process_image(config, image)
+        images.append(image)
+
+    # Look up every tag up front so that the rest of the run works from these
+    # results. When everything is up-to-date, no docker commands are needed at all.
+    wanted = {str(tag) for image in images for tag in image.all_tags}
+    with timed("prefetch", tags=len(wanted)):
+        bulk_index_digests(config.repo, sorted(wanted))
+
+    needs_build = config.republish or any(
+        index_digest(config.repo, image.build_tag) is None for image in images
+    )
+
+    native_builders = {}
+    if needs_build and native_cross_available(config.native_builders, config.build_archs):
+        logging.info("native builders available. each architecture will be built natively.")
+        native_builders = config.native_builders
+    elif needs_build and config.builder:
+        ensure_builder(
+            name=config.builder,
+            config_file=config.buildkit_config,
+            archs=config.build_archs,
+            max_parallelism=config.effective_buildkit_max_parallelism,
+            dry_run=config.dry_run,
+        )
+
+    with ThreadPoolExecutor(
+        max_workers=config.parallel_limit,
+        thread_name_prefix="pgedge",
+    ) as executor:
+        build_slots = threading.Semaphore(config.build_parallelism)
+        futures: list[Future] = []
+        try:
+            for image in images:
+                futures.append(executor.submit(_process_image, config, image, build_slots, native_builders))
+            for future in as_completed(futures):
+                future.result()
+            wait_for_signatures()
+        except BaseException as e:
+            # Don't build any more images once one has failed or we've been
+            # interrupted. Queued images are cancelled and images waiting for a
+            # build slot give up. After a failure, builds that are already
+            # running finish before we exit, and after an interrupt they're
+            # stopped too.
+            _image_failed.set()
+            for future in futures:
+                future.cancel()
+            if isinstance(e, KeyboardInterrupt):
+                _stop_work()
+            raise
 
 
 def get_latest_tags() -> list[str]:
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+# Unit tests for build_pgedge_images.py. Run them with `make test-scripts`, or
+# with `python3 -m unittest` from this directory.
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import build_pgedge_images as b
+
+
+def _image(**kwargs) -> b.PgEdgeImage:
+    fields = dict(
+        postgres_version="17.10",
+        spock_version="5.0.8",
+        epoch=1,
+        flavor="standard",
+        package_release_channel="staging",
+    )
+    fields.update(kwargs)
+    return b.PgEdgeImage(**fields)
+
+
+def _set_values(cmd: list[str]) -> list[str]:
+    return [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "--set"]
+
+
+class BakeTest(unittest.TestCase):
+    def bake(self, **kwargs):
+        calls = []
+
+        def fake_run(cmd, env=None, on_line=None):
+            calls.append((cmd, env))
+            metadata_file = cmd[cmd.index("--metadata-file") + 1]
+            with open(metadata_file, "w") as f:
+                json.dump({"default": {"containerimage.digest": "sha256:built"}}, f)
+
+        args = dict(
+            repo="registry.example.com/pgedge-postgres",
+            image=_image(),
+            tag="17.10-spock5.0.8-standard-1",
+            platforms=["amd64"],
+            no_cache=False,
+            compression="zstd",
+            cache_ref="registry.example.com/pgedge-postgres:buildcache-17-standard",
+        )
+        args.update(kwargs)
+        with mock.patch.object(b, "run", fake_run):
+            digest = b._bake(**args)
+
+        self.assertEqual(len(calls), 1)
+        cmd, env = calls[0]
+        return digest, cmd, env
+
+    def test_sets_platform_output_and_cache(self):
+        digest, cmd, env = self.bake()
+
+        self.assertEqual(digest, "sha256:built")
+        self.assertEqual(cmd[:3], ["docker", "buildx", "bake"])
+        self.assertIn("--push", cmd)
+        self.assertNotIn("--no-cache", cmd)
+        sets = _set_values(cmd)
+        self.assertIn("default.platform=linux/amd64", sets)
+        self.assertIn(
+            "default.output=type=registry,push=true,compression=zstd,oci-mediatypes=true",
+            sets,
+        )
+        self.assertIn(
+            "default.cache-from=type=registry,ref=registry.example.com/pgedge-postgres:buildcache-17-standard",
+            sets,
+        )
+        cache_to = [value for value in sets if value.startswith("default.cache-to=")]
+        self.assertEqual(len(cache_to), 1)
+        self.assertIn("ref=registry.example.com/pgedge-postgres:buildcache-17-standard,mode=max", cache_to[0])
+
+        self.assertEqual(env["TAG"], "registry.example.com/pgedge-postgres:17.10-spock5.0.8-standard-1")
+        self.assertEqual(env["TARGET"], "standard")
+        self.assertEqual(env["POSTGRES_MAJOR_VERSION"], "17")
+        self.assertEqual(env["PACKAGE_LIST_FILE"], _image().package_list)
+
+    def test_no_cache(self):
+        _, cmd, _ = self.bake(no_cache=True)
+
+        self.assertIn("--no-cache", cmd)
+        self.assertFalse(any(value.startswith("default.cache-from=") for value in _set_values(cmd)))
+
+    def test_multiple_platforms_and_compression(self):
+        _, cmd, _ = self.bake(platforms=["amd64", "arm64"], compression="gzip")
+
+        sets = _set_values(cmd)
+        self.assertIn("default.platform=linux/amd64,linux/arm64", sets)
+        self.assertIn(
+            "default.output=type=registry,push=true,compression=gzip,oci-mediatypes=true",
+            sets,
+        )
+
+    def test_environment_is_filtered(self):
+        with mock.patch.dict(os.environ, {"DOCKER_HOST": "unix:///docker.sock", "UNRELATED": "1"}):
+            _, _, env = self.bake(builder="arm-builder")
+
+        self.assertEqual(env["DOCKER_HOST"], "unix:///docker.sock")
+        self.assertEqual(env["BUILDX_BUILDER"], "arm-builder")
+        self.assertNotIn("UNRELATED", env)
+
+
+class BuildkitdConfigTest(unittest.TestCase):
+    def config(self, contents: str, max_parallelism: int) -> str:
+        with tempfile.NamedTemporaryFile("w", suffix=".toml", delete=False) as f:
+            f.write(contents)
+        self.addCleanup(os.unlink, f.name)
+        return b.buildkitd_config(f.name, max_parallelism)
+
+    def test_replaces_existing_setting(self):
+        result = self.config("[worker.oci]\n  max-parallelism = 8\n  gc = true\n", 2)
+
+        self.assertEqual(result, "[worker.oci]\n  max-parallelism = 2\n  gc = true\n")
+
+    def test_adds_worker_section(self):
+        result = self.config('[registry."host.docker.internal:5000"]\n  http = true\n', 1)
+
+        self.assertEqual(
+            result,
+            '[registry."host.docker.internal:5000"]\n  http = true\n[worker.oci]\n  max-parallelism = 1\n',
+        )
+
+    def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            b.buildkitd_config("/nonexistent/buildkitd.toml", 1)
+
+
+class BakeProgressTest(unittest.TestCase):
+    def test_logs_steps_and_output(self):
+        progress = b.BakeProgress()
+        with self.assertLogs(level="INFO") as logs:
+            progress("ERROR: not json")
+            progress(json.dumps({"vertexes": [{"digest": "sha256:1", "name": "[1/2] RUN dnf install"}]}))
+            progress(
+                json.dumps(
+                    {
+                        "vertexes": [
+                            {
+                                "digest": "sha256:1",
+                                "started": "2025-01-01T00:00:00Z",
+                                "completed": "2025-01-01T00:00:01.5Z",
+                            },
+                            {"digest": "sha256:2", "name": "[2/2] COPY", "completed": "x", "cached": True},
+                        ],
+                        "logs": [{"data": base64.b64encode(b"installing\ndone\n").decode()}],
+                    }
+                )
+            )
+            # Completed steps are only logged once.
+            progress(json.dumps({"vertexes": [{"digest": "sha256:2", "completed": "x", "cached": True}]}))
+
+        self.assertEqual(
+            [record.getMessage() for record in logs.records],
+            [
+                "ERROR: not json",
+                "step completed in 1.50s: [1/2] RUN dnf install",
+                "step cached: [2/2] COPY",
+                "installing",
+                "done",
+            ],
+        )
+
+    def test_logs_failed_step(self):
+        progress = b.BakeProgress()
+        with self.assertLogs(level="ERROR") as logs:
+            vertex = {"digest": "sha256:1", "name": "RUN false", "completed": "x", "error": "exit code 1"}
+            progress(json.dumps({"vertexes": [vertex]}))
+
+        self.assertEqual(logs.records[0].getMessage(), "step failed: RUN false: exit code 1")
+
+
+class ValidateImagesTest(unittest.TestCase):
+    def test_all_images_are_valid(self):
+        b.validate_images(b.all_images)
+
+    def test_duplicate_tags(self):
+        with self.assertRaisesRegex(ValueError, "17.10-spock5.0.8-standard-1"):
+            b.validate_images([_image(), _image()])
+
+
+class ConfigTest(unittest.TestCase):
+    def test_native_builders(self):
+        self.assertEqual(
+            b._parse_native_builders(" amd64=x86-builder, arm64=arm-builder ,"),
+            {"amd64": "x86-builder", "arm64": "arm-builder"},
+        )
+        with self.assertRaisesRegex(ValueError, "PGEDGE_IMAGE_NATIVE_BUILDERS.*'amd64'"):
+            b._parse_native_builders("amd64")
+
+    def test_parallelism_must_be_positive(self):
+        with mock.patch.dict(os.environ, {"PGEDGE_IMAGE_BUILD_PARALLELISM": "0"}):
+            with self.assertRaisesRegex(ValueError, "PGEDGE_IMAGE_BUILD_PARALLELISM"):
+                b.Config.from_env()
+
+    def test_build_archs(self):
+        with mock.patch.dict(os.environ, {"PGEDGE_IMAGE_ONLY_ARCH": "arm64"}):
+            config = b.Config.from_env()
+
+        self.assertEqual(config.build_archs, ["arm64"])
+        self.assertEqual(config.effective_buildkit_max_parallelism, config.buildkit_max_parallelism)
+
+
+class SplitRepoTest(unittest.TestCase):
+    def test_split_repo(self):
+        cases = {
+            "127.0.0.1:5000/pgedge-postgres": ("127.0.0.1:5000", "pgedge-postgres"),
+            "ghcr.io/pgedge/pgedge-postgres": ("ghcr.io", "pgedge/pgedge-postgres"),
+            "localhost/pgedge-postgres": ("localhost", "pgedge-postgres"),
+            "pgedge/pgedge-postgres": ("registry-1.docker.io", "pgedge/pgedge-postgres"),
+            "docker.io/postgres": ("registry-1.docker.io", "library/postgres"),
+            "postgres": ("registry-1.docker.io", "library/postgres"),
+        }
+        for repo, expected in cases.items():
+            with self.subTest(repo=repo):
+                self.assertEqual(b._split_repo(repo), expected)
+
+
+class _Registry(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    manifest = json.dumps({"manifests": []}).encode()
+    # Set by the tests: "bearer", "basic" or a status code to always respond with.
+    mode = "bearer"
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status: int, body: bytes = b"", headers: dict[str, str] | None = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.do_HEAD()
+
+    def do_HEAD(self):
+        if isinstance(self.mode, int):
+            return self._respond(self.mode)
+        if self.path.startswith("/token"):
+            return self._respond(200, json.dumps({"token": "secret"}).encode())
+
+        expected = "Bearer secret" if self.mode == "bearer" else "Basic " + base64.b64encode(b"user:pass").decode()
+        if self.headers.get("Authorization") != expected:
+            if self.mode == "bearer":
+                challenge = f'Bearer realm="http://{self.headers["Host"]}/token",service="registry"'
+            else:
+                challenge = 'Basic realm="registry"'
+            return self._respond(401, headers={"WWW-Authenticate": challenge})
+
+        if not self.path.endswith("/manifests/published"):
+            return self._respond(404)
+        digest = "sha256:" + hashlib.sha256(self.manifest).hexdigest()
+        self._respond(200, self.manifest, {"Docker-Content-Digest": digest})
+
+
+class RegistryClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Registry)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.repo = f"127.0.0.1:{cls.server.server_port}/pgedge-postgres"
+        cls.digest = "sha256:" + hashlib.sha256(_Registry.manifest).hexdigest()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        config_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(config_dir.cleanup)
+        self.config_dir = config_dir.name
+        patcher = mock.patch.dict(os.environ, {"DOCKER_CONFIG": self.config_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_mode(self, mode):
+        patcher = mock.patch.object(_Registry, "mode", mode)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client(self) -> b.RegistryClient:
+        client = b.RegistryClient(self.repo)
+        # Connections are kept open per thread, so close this thread's.
+        self.addCleanup(client._reset_connection)
+        return client
+
+    def write_credentials(self, host: str):
+        with open(os.path.join(self.config_dir, "config.json"), "w") as f:
+            json.dump({"auths": {host: {"auth": base64.b64encode(b"user:pass").decode()}}}, f)
+
+    def test_bearer_token(self):
+        client = self.client()
+
+        self.assertEqual(client.manifest_digest("published"), self.digest)
+        self.assertIsNone(client.manifest_digest("missing"))
+
+    def test_basic_credentials(self):
+        self.set_mode("basic")
+        self.write_credentials(f"127.0.0.1:{self.server.server_port}")
+
+        self.assertEqual(self.client().manifest_digest("published"), self.digest)
+
+    def test_basic_without_credentials(self):
+        self.set_mode("basic")
+
+        with self.assertRaises(b.RegistryAuthError):
+            self.client().manifest_digest("published")
+
+    def test_unexpected_status(self):
+        self.set_mode(503)
+
+        with self.assertRaises(b.RegistryError):
+            self.client().manifest_digest("published")
+
+    def test_falls_back_when_unreachable(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        repo = f"127.0.0.1:{port}/pgedge-postgres"
+
+        with mock.patch.object(b, "_inspect_index_digest", return_value="sha256:inspected") as inspect:
+            # The second lookup reuses the client, which must not be stuck on the
+            # first lookup's failed connection.
+            self.assertEqual(b._fetch_index_digest(repo, "published"), "sha256:inspected")
+            self.assertEqual(b._fetch_index_digest(repo, "published"), "sha256:inspected")
+
+        self.assertEqual(inspect.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()